@@ -1,130 +1,292 @@
-"""Python コードを読みこみ、メソッドとフィールドの関係を解析する."""
+"""Python コードを読みこみ、メソッドとフィールドの関係を解析する.
+
+型注釈がそろっているため、mypyc でネイティブ拡張にコンパイルできます。
+    mypyc create_dependency.py create_dependency_plantuml.py
+生成された拡張モジュールは同名の .py より優先して import されます。
+"""
 
 from __future__ import annotations
 
 import ast
+import hashlib
+import itertools
+import os
+import pathlib
+import pickle
+import tempfile
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from typing import ClassVar
 
 
 # [型エイリアス] 関数名と、関数内で使用しているメンバー変数
-_FuncToAttrType = dict[str, list[str]]
+FuncToAttrType = dict[str, list[str]]
 # [型エイリアス] 未使用メンバー変数のセット
-_UnreferencedVarSetType = set[str]
-# [型エイリアス] クラス名、_FuncToAttrType、未使用メンバー変数のセット
-ClassToFuncType = dict[str, tuple[_FuncToAttrType, _UnreferencedVarSetType]]
+UnreferencedVarSetType = set[str]
+# [型エイリアス] いずれかの関数から参照されているメンバー変数のセット
+ReferencedVarSetType = frozenset[str]
+# [型エイリアス] FuncToAttrType、未使用メンバー変数のセット、参照されているメンバー変数のセット
+ClassRelationType = tuple[FuncToAttrType, UnreferencedVarSetType, ReferencedVarSetType]
+# [型エイリアス] クラス名と ClassRelationType
+ClassToFuncType = dict[str, ClassRelationType]
+# [型エイリアス] キャッシュ形式のバージョン、ファイルの更新時刻 (ns)、ファイルサイズ
+_CacheStampType = tuple[int, int, int]
 
 
 class _CodeReader:
     """Pythonコードをファイルから読み込むクラス。"""
 
     @staticmethod
-    def read_from_file(file_path: str) -> str:
-        """指定されたファイルパスからPythonコードを読み込む。"""
-        with open(file_path, 'r', encoding='utf-8') as f:
+    def read_from_file(file_path: str) -> bytes:
+        """指定されたファイルパスからPythonコードをバイト列のまま読み込む。
+
+        デコードは ast.parse に任せる（UTF-8 を既定として、BOM や coding 宣言も解釈される）。
+        """
+        with open(file_path, 'rb') as f:
             return f.read()
 
 
+class _ResultCache:
+    """解析結果をディスクへキャッシュするクラス。
+
+    キャッシュファイルはソースファイルのパスごとに 1 つで、形式のバージョン・更新時刻・サイズを
+    結果と一緒に保存する。ソースが更新されると、次の保存で同じファイルが上書きされる。
+    """
+
+    # 解析結果の形式を変えたら上げる
+    _VERSION: ClassVar[int] = 4
+
+    @classmethod
+    def stamp(cls, file_path: str) -> _CacheStampType:
+        """キャッシュが有効かを判定するための、形式のバージョン・更新時刻・サイズを返す。"""
+        # 更新時刻の分解能が粗いファイルシステムもあるため、サイズも含める
+        stat = os.stat(file_path)
+        return cls._VERSION, stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def load(cls, file_path: str, stamp: _CacheStampType) -> ClassToFuncType | None:
+        """stamp が一致するキャッシュ済みの解析結果を返す。なければ None を返す。"""
+        try:
+            with open(cls._cache_path(file_path), 'rb') as f:
+                cached_stamp, class_relations = pickle.load(f)
+        except Exception:
+            # 読めない・壊れている・存在しないクラスを参照しているなど、どんな失敗でも解析し直す
+            return None
+        if cached_stamp != stamp:
+            return None
+        result: ClassToFuncType = class_relations
+        return result
+
+    @classmethod
+    def store(cls, file_path: str, stamp: _CacheStampType, class_relations: ClassToFuncType) -> None:
+        """解析結果をキャッシュに保存する。保存できなくても解析は続ける。"""
+        try:
+            cache_dir = cls._cache_dir()
+            cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            # 並列に解析しているプロセスが書きかけのファイルを読まないよう、一時ファイルから置き換える
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump((stamp, class_relations), f)
+                os.replace(tmp_path, cls._cache_path(file_path))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, RuntimeError):
+            pass
+
+    @classmethod
+    def _cache_dir(cls) -> pathlib.Path:
+        """キャッシュの保存先を返す。
+
+        他のユーザーが書き込めないよう、ユーザーごとのディレクトリに置く。
+        ホームディレクトリが決まらない環境では RuntimeError になるため、import 時ではなく使うときに求める。
+        """
+        return pathlib.Path.home() / ".cache" / "create_dependency"
+
+    @classmethod
+    def _cache_path(cls, file_path: str) -> pathlib.Path:
+        """キャッシュファイルのパスを返す。"""
+        path = os.path.abspath(file_path)
+        return cls._cache_dir() / f"{hashlib.blake2b(path.encode()).hexdigest()}.pkl"
+
+
+class _ClassMemberVisitor(ast.NodeVisitor):
+    """クラスの AST を 1 回走査して、関数・メンバ変数と、関数ごとの属性参照を収集するクラス。"""
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self.functions: set[str] = set()
+        self.member_vars: set[str] = set()
+        # 関数名と、関数内で参照している属性名
+        self.function_attrs: dict[str, set[str]] = {}
+        # 走査中の関数の属性名セット（外側の関数から順に積む）
+        self._attrs_stack: list[set[str]] = []
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        """関数名を記録し、関数内を走査する。"""
+        # プロパティも関数定義なので、ここで関数名として記録される
+        self.functions.add(node.name)
+
+        if node.name == '__init__':
+            self.generic_visit(node)
+            return
+
+        attrs: set[str] = set()
+        self.function_attrs[node.name] = attrs
+        self._attrs_stack.append(attrs)
+        self.generic_visit(node)
+        self._attrs_stack.pop()
+
+    def visit_Assign(self, node: ast.Assign) -> None:
+        """self への代入をメンバ変数として記録する。"""
+        for target in node.targets:
+            if type(target) is ast.Attribute:
+                value = target.value
+                if type(value) is ast.Name and value.id == 'self':
+                    self.member_vars.add(target.attr)
+        self.generic_visit(node)
+
+    def visit_Expr(self, node: ast.Expr) -> None:
+        """docstring など定数だけの式文は、属性参照を含まないので走査しない。"""
+        if type(node.value) is ast.Constant:
+            return
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        """self の属性参照を、走査中のすべての関数に記録する。"""
+        value = node.value
+        if type(value) is ast.Name and value.id == 'self':
+            for attrs in self._attrs_stack:
+                attrs.add(node.attr)
+        self.generic_visit(node)
+
+
 class CodeAnalyzer:
     """Pythonコードを解析するクラス。"""
 
     @classmethod
     def analyze_code(cls, file_path: str) -> ClassToFuncType:
-        """Pythonコードを解析して、各クラスの関数とメンバー変数の関係を表す辞書を生成する。"""
-        code = _CodeReader.read_from_file(file_path)
-        tree = ast.parse(code)
+        """Pythonコードを解析して、各クラスの関数とメンバー変数の関係を表す辞書を生成する。
 
-        class_relations = {}
-        for node in ast.walk(tree):
-            if not isinstance(node, ast.ClassDef):
-                continue
-            class_node = node
-            class_name = class_node.name
-            class_relations[class_name] = cls._analyze_class_node(class_node)
-
-        return class_relations
+        同じファイルを更新せずに解析し直した場合は、キャッシュした結果を返す。
+        """
+        return dict(cls.iter_class_relations(file_path))
 
     @classmethod
-    def _analyze_class_node(cls, class_node: ast.ClassDef) -> tuple[_FuncToAttrType, set[str]]:
-        """クラスのASTノードを解析して、関数とメンバー変数の関係を表す辞書を生成する。"""
-        member_vars = cls._get_member_vars(class_node)
+    def iter_class_relations(cls, file_path: str) -> Iterator[tuple[str, ClassRelationType]]:
+        """Pythonコードを解析して、クラス名と関数・メンバー変数の関係を、解析できたクラスから順に返す。
 
-        # 関数とメンバー変数の関係
-        relations = cls._analyze_function_to_var_relations(class_node, member_vars)
-        # どの関数からも参照されていないメンバー変数
-        unreferenced_vars = cls._find_unreferenced_vars(relations, member_vars)
+        ファイルの読み込みと構文解析はこの呼び出しの中で済ませるため、
+        ファイルが存在しない場合や構文エラーの場合は、結果を 1 件も返す前に例外を送出する。
+        最後まで読み進めた場合だけ、結果をキャッシュに保存する。
+        """
+        stamp = _ResultCache.stamp(file_path)
+        cached = _ResultCache.load(file_path, stamp)
+        if cached is not None:
+            return iter(cached.items())
 
-        return relations, unreferenced_vars
+        code = _CodeReader.read_from_file(file_path)
+        # ast.parse を経由せず、AST だけを返すよう直接 compile する
+        tree = compile(code, file_path, 'exec', flags=ast.PyCF_ONLY_AST, dont_inherit=True)
+
+        return cls._iter_analyzed_classes(file_path, stamp, tree)
 
     @classmethod
-    def _analyze_function_to_var_relations(
+    def _iter_analyzed_classes(
             cls,
-            class_node: ast.ClassDef,
-            member_vars: set[str]) -> _FuncToAttrType:
-        relations: _FuncToAttrType = {}
-
-        properties = cls._get_properties(class_node)
-        functions = cls._get_functions(class_node)
+            file_path: str,
+            stamp: _CacheStampType,
+            tree: ast.AST) -> Iterator[tuple[str, ClassRelationType]]:
+        """構文解析済みの AST からクラスを 1 つずつ解析して返し、最後に結果をキャッシュへ保存する。"""
+        class_relations: ClassToFuncType = {}
+        for class_node in cls._iter_class_nodes(tree):
+            class_name = class_node.name
+            class_relation = cls._analyze_class_node(class_node)
+            class_relations[class_name] = class_relation
+            yield class_name, class_relation
 
-        for sub_node in ast.walk(class_node):
-            if not isinstance(sub_node, ast.FunctionDef):
-                continue
+        _ResultCache.store(file_path, stamp, class_relations)
 
-            function_name = sub_node.name
-            if function_name == '__init__':
-                continue
+    @classmethod
+    def analyze_files(cls, file_paths: list[str]) -> ClassToFuncType:
+        """複数のPythonファイルをプロセスごとに並列で解析し、結果を 1 つの辞書にまとめる。
 
-            relations[function_name] = []
+        ファイル間で同名のクラスが消えないよう、キーはファイル数によらず常に「モジュール名.クラス名」とする。
+        モジュール名は、全ファイルに共通するディレクトリからの相対パスをドット区切りにしたもの。
+        """
+        # 同じファイルが複数回指定されても 1 回だけ解析する
+        unique_paths = list(dict.fromkeys(os.path.abspath(file_path) for file_path in file_paths))
+        module_names = cls._module_names(unique_paths)
 
-            for attr_node in ast.walk(sub_node):
-                if not isinstance(attr_node, ast.Attribute):
-                    continue
+        if len(unique_paths) <= 1:
+            # プロセスの起動コストに見合わないので、そのまま解析する
+            results = [cls.analyze_code(file_path) for file_path in unique_paths]
+        else:
+            with ProcessPoolExecutor() as executor:
+                results = list(executor.map(cls.analyze_code, unique_paths))
 
-                attribute_name = attr_node.attr
-                if attribute_name in properties:
-                    continue
-                if attribute_name in functions:
-                    continue
-                if attribute_name not in member_vars:
-                    continue
+        class_relations: ClassToFuncType = {}
+        for module_name, file_relations in zip(module_names, results):
+            for class_name, class_relation in file_relations.items():
+                class_relations[f"{module_name}.{class_name}"] = class_relation
+        return class_relations
 
-                relations[function_name].append(attribute_name)
+    @classmethod
+    def _module_names(cls, abs_paths: list[str]) -> list[str]:
+        """全ファイルに共通するディレクトリからの相対パスを、ドット区切りのモジュール名にする。
 
-        return relations
+        拡張子だけを落とし、__init__ は残すため、異なるファイルが同じ名前になることはない。
+        """
+        if not abs_paths:
+            return []
+        common_dir = os.path.commonpath([os.path.dirname(path) for path in abs_paths])
+        module_names = []
+        for path in abs_paths:
+            relative_path = os.path.splitext(os.path.relpath(path, common_dir))[0]
+            module_names.append(".".join(pathlib.PurePath(relative_path).parts))
+        return module_names
 
     @classmethod
-    def _get_properties(cls, class_node: ast.ClassDef) -> set[str]:
-        """プロパティ名の一覧を取得する."""
-        properties = set()
-        for sub_node in ast.walk(class_node):
-            if isinstance(sub_node, ast.FunctionDef):
-                for decorator in sub_node.decorator_list:
-                    if isinstance(decorator, ast.Name) and decorator.id == "property":
-                        properties.add(sub_node.name)
-        return properties
+    def _iter_class_nodes(cls, node: ast.AST) -> Iterator[ast.ClassDef]:
+        """クラス定義を列挙する。関数の本体と式の中には降りない。"""
+        function_defs = (ast.FunctionDef, ast.AsyncFunctionDef)
+        for child in ast.iter_child_nodes(node):
+            if type(child) is ast.ClassDef:
+                yield child
+            elif type(child) in function_defs or isinstance(child, ast.expr):
+                # 式は抽象クラス ast.expr の派生なので isinstance で判定する
+                continue
+            yield from cls._iter_class_nodes(child)
 
     @classmethod
-    def _get_functions(cls, class_node: ast.ClassDef) -> set[str]:
-        """関数名の一覧を取得する。"""
-        functions = set()
-        for sub_node in ast.walk(class_node):
-            if isinstance(sub_node, ast.FunctionDef):
-                functions.add(sub_node.name)
-        return functions
+    def _analyze_class_node(cls, class_node: ast.ClassDef) -> ClassRelationType:
+        """クラスのASTノードを解析して、関数とメンバー変数の関係を表す辞書を生成する。"""
+        visitor = _ClassMemberVisitor()
+        visitor.visit(class_node)
 
-    @classmethod
-    def _get_member_vars(cls, class_node: ast.ClassDef) -> set[str]:
-        """メンバ変数の一覧を取得する。"""
-        member_vars = set()
-        for sub_node in ast.walk(class_node):
-            if isinstance(sub_node, ast.Assign):
-                for target in sub_node.targets:
-                    if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == 'self':
-                        member_vars.add(target.attr)
-        return member_vars
+        # プロパティと関数はメンバー変数として扱わない
+        skip_names = frozenset(visitor.functions)
+        member_names = frozenset(visitor.member_vars)
+
+        # 関数とメンバー変数の関係
+        relations = cls._analyze_function_to_var_relations(visitor.function_attrs, skip_names, member_names)
+        # いずれかの関数から参照されているメンバー変数と、どの関数からも参照されていないメンバー変数
+        referenced_vars = cls._find_referenced_vars(relations)
+        unreferenced_vars = visitor.member_vars - referenced_vars
+
+        return relations, unreferenced_vars, referenced_vars
 
     @classmethod
-    def _find_unreferenced_vars(cls, relations: _FuncToAttrType, member_vars: set[str]) -> _UnreferencedVarSetType:
-        all_referenced_vars = set()
-        for function, vars in relations.items():
-            all_referenced_vars.update(vars)
+    def _analyze_function_to_var_relations(
+            cls,
+            function_attrs: dict[str, set[str]],
+            skip_names: frozenset[str],
+            member_names: frozenset[str]) -> FuncToAttrType:
+        # 関係として記録する属性名（1 クラスにつき 1 回だけ求める）
+        referable_names = member_names - skip_names
+        return {function_name: sorted(attrs & referable_names) for function_name, attrs in function_attrs.items()}
 
-        return member_vars - all_referenced_vars
+    @classmethod
+    def _find_referenced_vars(cls, relations: FuncToAttrType) -> ReferencedVarSetType:
+        return frozenset(itertools.chain.from_iterable(relations.values()))
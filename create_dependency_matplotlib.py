@@ -1,50 +1,62 @@
 """Python コードを読みこみ、メソッドとフィールドとの関係を matplotlib で描画するツール."""
 
-import argparse
+from __future__ import annotations
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-import networkx as nx
+import argparse
+from typing import TYPE_CHECKING
 
 import create_dependency
 
+# matplotlib と networkx は読み込みが重いため、描画時に import する
+if TYPE_CHECKING:
+    import networkx as nx
+    import numpy as np
+
 
 _COLOR_CLASS = '#FF4040'
 _COLOR_FUNCTION = '#0080FF'
 _COLOR_FIELD = '#80FF00'
 _COLOR_UNUSED = '#808080'
 
+# レイアウト計算の乱数シードと反復回数
+_LAYOUT_SEED = 42
+_LAYOUT_ITERATIONS = 20
+
 
 class GraphBuilder:
     """グラフのノードとエッジを追加するクラス"""
 
     def __init__(self) -> None:
         """コンストラクタ"""
+        import networkx as nx
+
         self.graph = nx.DiGraph()
 
     def add_nodes_and_edges(
             self,
             class_name: str,
-            func_to_attr: dict[str, list[str]],
-            unused_vars: set[str]) -> None:
+            func_to_attr: create_dependency.FuncToAttrType,
+            unused_vars: create_dependency.UnreferencedVarSetType) -> None:
         """ノードとエッジを追加するメソッド"""
-        self.graph.add_node(class_name, color=_COLOR_CLASS)
-
-        # 未使用変数を追加
-        for unused_var in unused_vars:
-            full_unused_var_name = f"{unused_var}"
-            self.graph.add_node(full_unused_var_name, color=_COLOR_UNUSED)
-            self.graph.add_edge(class_name, full_unused_var_name)
+        # 未使用変数
+        unused_nodes = [(unused_var, {'color': _COLOR_UNUSED}) for unused_var in unused_vars]
+        edges = [(class_name, unused_var) for unused_var in unused_vars]
 
+        func_nodes = []
+        field_nodes = {}
         for func_name, attrs in func_to_attr.items():
-            full_func_name = f"{func_name}"
-            self.graph.add_node(full_func_name, color=_COLOR_FUNCTION)
-            self.graph.add_edge(class_name, full_func_name)
+            func_nodes.append((func_name, {'color': _COLOR_FUNCTION}))
+            edges.append((class_name, func_name))
 
             for attr in attrs:
-                full_attr_name = f"{attr}"
-                self.graph.add_node(full_attr_name, color=_COLOR_FIELD)
-                self.graph.add_edge(full_func_name, full_attr_name)
+                field_nodes[attr] = {'color': _COLOR_FIELD}
+                edges.append((func_name, attr))
+
+        self.graph.add_node(class_name, color=_COLOR_CLASS)
+        self.graph.add_nodes_from(unused_nodes)
+        self.graph.add_nodes_from(func_nodes)
+        self.graph.add_nodes_from(field_nodes.items())
+        self.graph.add_edges_from(edges)
 
 
 class GraphStyler:
@@ -54,9 +66,19 @@ class GraphStyler:
         """コンストラクタ"""
         self.graph = graph
 
-    def apply_style(self) -> dict:
-        """スタイルを適用するメソッド"""
-        return {node: data['color'] for node, data in self.graph.nodes(data=True)}
+    def apply_style(self) -> tuple[dict[str, int], np.ndarray]:
+        """スタイルを適用するメソッド
+
+        ノード名から行番号への辞書と、各行がノードの色 (RGBA) である配列を返す。
+        """
+        import matplotlib.colors as mcolors
+
+        node_index = {}
+        color_codes = []
+        for idx, (node, data) in enumerate(self.graph.nodes(data=True)):
+            node_index[node] = idx
+            color_codes.append(data['color'])
+        return node_index, mcolors.to_rgba_array(color_codes)
 
 
 class GraphRenderer:
@@ -66,8 +88,10 @@ class GraphRenderer:
         """コンストラクタ"""
         self.graph = graph
 
-    def render(self, colors: dict[str, str], class_names: list[str]) -> None:
+    def render(self, colors: tuple[dict[str, int], np.ndarray], class_names: list[str]) -> None:
         """複数のグラフを描画するメソッド"""
+        import matplotlib.pyplot as plt
+
         for idx, class_name in enumerate(class_names):
             subG = self._create_subgraph_for_class(class_name)
             self._draw_single_graph(subG, colors, idx)
@@ -76,30 +100,33 @@ class GraphRenderer:
         plt.show()  # すべてのウィンドウを一度に表示
 
     def _create_subgraph_for_class(self, class_name: str) -> nx.DiGraph:
-        sub_nodes = [class_name]
-
-        # 直接的な子孫ノード（メソッド、フィールド）を取得
-        descendants = list(self.graph.successors(class_name))
-        sub_nodes.extend(descendants)
+        import networkx as nx
 
-        # 子孫ノードから更に繋がる子孫（基本的にフィールド）を取得
-        for desc in descendants:
-            sub_descendants = list(self.graph.successors(desc))
-            sub_nodes.extend(sub_descendants)
+        # クラスから 2 ホップ以内（メソッド、フィールド）のノードを取得
+        return nx.ego_graph(self.graph, class_name, radius=2)
 
-        return self.graph.subgraph(sub_nodes)
-
-    def _draw_single_graph(self, subG: nx.DiGraph, colors: dict[str, str], figure_idx: int) -> None:
+    def _draw_single_graph(
+            self,
+            subG: nx.DiGraph,
+            colors: tuple[dict[str, int], np.ndarray],
+            figure_idx: int) -> None:
         """単一のグラフを描画する"""
+        import matplotlib.pyplot as plt
+        import networkx as nx
+
         plt.figure(figure_idx)
 
-        pos = nx.spring_layout(subG)
-        nx.draw(subG, pos, with_labels=True, node_color=[colors[n] for n in subG.nodes()])
+        pos = nx.spring_layout(subG, seed=_LAYOUT_SEED, iterations=_LAYOUT_ITERATIONS)
+        node_index, rgba = colors
+        nx.draw(subG, pos, with_labels=True, node_color=rgba[[node_index[n] for n in subG.nodes()]])
 
         self._add_legend()
 
     def _add_legend(self) -> None:
         """凡例を追加する."""
+        import matplotlib.patches as mpatches
+        import matplotlib.pyplot as plt
+
         red_patch = mpatches.Patch(color=_COLOR_CLASS, label='Class')
         blue_patch = mpatches.Patch(color=_COLOR_FUNCTION, label='Function')
         green_patch = mpatches.Patch(color=_COLOR_FIELD, label='Field')
@@ -109,7 +136,7 @@ class GraphRenderer:
 
 def _draw_single_class_graph(class_name: str, class_to_func_data: create_dependency.ClassToFuncType) -> None:
     """単一のクラスのグラフを描画する主要な処理を行う関数"""
-    func_to_attr, unused_vars = class_to_func_data[class_name]
+    func_to_attr, unused_vars, _ = class_to_func_data[class_name]
     builder = GraphBuilder()
     builder.add_nodes_and_edges(class_name, func_to_attr, unused_vars)
 
@@ -129,10 +156,14 @@ def draw_class_to_func_graph(class_to_func_data: create_dependency.ClassToFuncTy
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='Analyze Python code and draw graph for function and member variable relationships.')
-    parser.add_argument('file_path', type=str, help='Path to the Python file to analyze')
+    parser.add_argument('file_paths', type=str, nargs='+', help='Paths to the Python files to analyze')
 
     args = parser.parse_args()
-    file_path = args.file_path
+    file_paths = args.file_paths
 
-    class_relations = create_dependency.CodeAnalyzer.analyze_code(file_path)
+    if len(file_paths) == 1:
+        class_relations = create_dependency.CodeAnalyzer.analyze_code(file_paths[0])
+    else:
+        # 複数ファイルはプロセスごとに並列で解析する
+        class_relations = create_dependency.CodeAnalyzer.analyze_files(file_paths)
     draw_class_to_func_graph(class_relations)
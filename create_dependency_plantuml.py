@@ -8,6 +8,10 @@
 from __future__ import annotations
 
 import argparse
+import io
+import sys
+from collections.abc import Iterable
+from typing import TextIO
 
 import create_dependency
 
@@ -18,81 +22,88 @@ class PlantUMLGenerator:
     @classmethod
     def generate(cls, class_relations: create_dependency.ClassToFuncType) -> str:
         """PlantUML形式のコードを生成する。"""
-        plantuml_code = "@startuml\n"
-        for class_name, (relations, unused_vars) in class_relations.items():
-            plantuml_code += f"rectangle {class_name} {{\n"
-            plantuml_code += _AttributeSectionGenerator.generate(relations, unused_vars)
-            plantuml_code += _FunctionSectionGenerator.generate(relations)
-            plantuml_code += _RelationsSectionGenerator.generate(relations)
-            plantuml_code += _UnusedVarsSectionGenerator.generate(unused_vars)
-            plantuml_code += "}\n"
-        plantuml_code += "@enduml\n"
-        return plantuml_code
+        buf = io.StringIO()
+        cls.write(class_relations, buf)
+        return buf.getvalue()
 
-
-class _AttributeSectionGenerator:
-    """属性部分のPlantUMLコードを生成するクラス。"""
+    @classmethod
+    def write(cls, class_relations: create_dependency.ClassToFuncType, out: TextIO) -> None:
+        """PlantUML形式のコードを、文字列にまとめずに out へ順次書き出す。"""
+        cls.write_iter(class_relations.items(), out)
 
     @classmethod
-    def generate(cls, relations: dict[str, list[str]], unused_vars: set[str]) -> str:
-        """属性部分のPlantUMLコードを生成する。"""
-        attributes = set()
-        for _, attribute_list in relations.items():
-            attributes.update(attribute_list)
-        attributes.update(unused_vars)
-        attribute_section = ""
-        for attribute in attributes:
-            attribute_section += f"() {attribute}\n"
-        return attribute_section
+    def write_iter(
+            cls,
+            class_relations: Iterable[tuple[str, create_dependency.ClassRelationType]],
+            out: TextIO) -> None:
+        """クラス名と関係の組を受け取るたびに、そのクラスの PlantUML 形式のコードを out へ書き出す。"""
+        out.write("@startuml\n")
+        # 1 クラス分のコードをためてから out へ書き出すバッファ（クラス間で使い回す）
+        buf = io.StringIO()
+        for class_name, (relations, unused_vars, referenced_vars) in class_relations:
+            buf.seek(0)
+            buf.truncate(0)
+            buf.write(f"rectangle {class_name} {{\n")
+            _AttributeSectionGenerator.write(buf, referenced_vars, unused_vars)
+            _FunctionAndRelationsSectionGenerator.write(buf, relations)
+            _UnusedVarsSectionGenerator.write(buf, unused_vars)
+            buf.write("}\n")
+            out.write(buf.getvalue())
+        out.write("@enduml\n")
 
 
-class _FunctionSectionGenerator:
-    """関数部分のPlantUMLコードを生成するクラス。"""
+class _AttributeSectionGenerator:
+    """属性部分のPlantUMLコードを生成するクラス。"""
 
     @classmethod
-    def generate(cls, relations: dict[str, list[str]]) -> str:
-        """関数部分のPlantUMLコードを生成する。"""
-        function_section = ""
-        for function_name, _ in relations.items():
-            function_section += f"() f_{function_name}\n"
-        return function_section
+    def write(
+            cls,
+            out: TextIO,
+            referenced_vars: create_dependency.ReferencedVarSetType,
+            unused_vars: create_dependency.UnreferencedVarSetType) -> None:
+        """属性部分のPlantUMLコードを書き出す。"""
+        out.write("".join([f"() {attribute}\n" for attribute in referenced_vars | unused_vars]))
 
 
-class _RelationsSectionGenerator:
-    """関係性を示すPlantUMLコードを生成するクラス。"""
+class _FunctionAndRelationsSectionGenerator:
+    """関数部分と、関係性を示すPlantUMLコードを生成するクラス。"""
 
     @classmethod
-    def generate(cls, relations: dict[str, list[str]]) -> str:
-        """関係性を示すPlantUMLコードを生成する。"""
-        relations_section = ""
+    def write(cls, out: TextIO, relations: create_dependency.FuncToAttrType) -> None:
+        """関数部分と関係性を示すPlantUMLコードを、relations を 1 回だけ走査して書き出す。"""
+        function_parts: list[str] = []
+        relation_parts: list[str] = []
         for function_name, attribute_list in relations.items():
+            function_parts.append(f"() f_{function_name}\n")
             for attribute in attribute_list:
-                relations_section += f"f_{function_name} --> {attribute}\n"
-        return relations_section
+                relation_parts.append(f"f_{function_name} --> {attribute}\n")
+        out.write("".join(function_parts))
+        out.write("".join(relation_parts))
 
 
 class _UnusedVarsSectionGenerator:
     """未使用変数部分のPlantUMLコードを生成するクラス。"""
 
     @classmethod
-    def generate(cls, unused_vars: set[str]) -> str:
-        """未使用変数部分のPlantUMLコードを生成する。"""
-        unused_vars_section = ""
-        for unused_var in unused_vars:
-            unused_vars_section += f"() {unused_var} <<unused>>\n"
-        return unused_vars_section
+    def write(cls, out: TextIO, unused_vars: create_dependency.UnreferencedVarSetType) -> None:
+        """未使用変数部分のPlantUMLコードを書き出す。"""
+        out.write("".join([f"() {unused_var} <<unused>>\n" for unused_var in unused_vars]))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='Analyze Python code and generate PlantUML code for function and member variable relationships.')
-    parser.add_argument('file_path', type=str, help='Path to the Python file to analyze')
+    parser.add_argument('file_paths', type=str, nargs='+', help='Paths to the Python files to analyze')
 
     args = parser.parse_args()
-    file_path = args.file_path
-
-    class_relations = create_dependency.CodeAnalyzer.analyze_code(file_path)
+    file_paths = args.file_paths
 
-    plantuml_code = PlantUMLGenerator.generate(class_relations)
+    class_relations: Iterable[tuple[str, create_dependency.ClassRelationType]]
+    if len(file_paths) == 1:
+        # 解析できたクラスから順に出力し、全クラス分の結果がそろうのを待たない
+        class_relations = create_dependency.CodeAnalyzer.iter_class_relations(file_paths[0])
+    else:
+        # 複数ファイルはプロセスごとに並列で解析する
+        class_relations = create_dependency.CodeAnalyzer.analyze_files(file_paths).items()
 
-    print(plantuml_code)
+    PlantUMLGenerator.write_iter(class_relations, sys.stdout)